@@ -0,0 +1,108 @@
+"""compact the secrets baseline: prune the files deleted from the depot or excluded from the scan,
+normalize and deduplicate the filenames, then report the size and load time reduction.
+Run it from the workspace root.
+"""
+
+from P4 import P4
+from detect_secrets import SecretsCollection
+from detect_secrets.core import baseline
+from detect_secrets_utils import do_exclude_file, get_deleted_files, normalize_baseline_filename, SECRET_BASELINE
+import argparse
+import json
+import time
+
+
+def load_secrets(baseline_content: str, baseline_filename: str):
+    start = time.perf_counter()
+    secrets = baseline.load(json.loads(baseline_content), filename=baseline_filename)
+    return secrets, time.perf_counter() - start
+
+
+def count_secrets(secrets: SecretsCollection) -> int:
+    return sum(len(secrets.data[filename]) for filename in secrets.files)
+
+
+def normalize_secrets(secrets: SecretsCollection) -> SecretsCollection:
+    """Merge the entries of filenames only differing by their separators, keeping the audited secrets."""
+
+    normalized_secrets = SecretsCollection()
+    for filename in sorted(secrets.files):
+        normalized_filename = normalize_baseline_filename(filename)
+
+        # This allows us to obtain the same secret, by accessing the hash.
+        mapping = {secret: secret for secret in normalized_secrets.data[normalized_filename]}
+        for secret in secrets.data[filename]:
+            secret.filename = normalized_filename
+            if secret not in mapping or (mapping[secret].is_secret is None and secret.is_secret is not None):
+                mapping[secret] = secret
+        normalized_secrets.data[normalized_filename] = set(mapping.values())
+    return normalized_secrets
+
+
+def count_duplicated_false_positives(secrets: SecretsCollection):
+    files_per_hash = {}
+    for filename in secrets.files:
+        for secret in secrets.data[filename]:
+            if secret.is_secret is False:
+                files_per_hash.setdefault(secret.secret_hash, set()).add(filename)
+    duplicated = [filenames for filenames in files_per_hash.values() if len(filenames) > 1]
+    return len(duplicated), sum(len(filenames) for filenames in duplicated)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("client")
+    parser.add_argument("--baseline", default=SECRET_BASELINE, help="Baseline file to compact.")
+    parser.add_argument("-c", "--changelist", default="default", help="Changelist to open the baseline in.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Number of files checked per p4 fstat call.")
+    parser.add_argument("--dry-run", default=False, action="store_true", help="Only report, don't write the baseline.")
+    args = parser.parse_args()
+
+    p4 = P4()
+    p4.exception_level = 1  # don't raise on warnings
+    p4.client = args.client
+    p4.connect()
+
+    with open(args.baseline, "r") as fd:
+        baseline_content = fd.read()
+    secrets, load_time = load_secrets(baseline_content, args.baseline)
+
+    compacted = normalize_secrets(secrets)
+    merged_file_count = len(secrets.files) - len(compacted.files)
+
+    excluded_files = {filename for filename in compacted.files if do_exclude_file(filename)}
+    deleted_files, unchecked_files = get_deleted_files(p4, sorted(compacted.files - excluded_files), args.batch_size)
+    for filename in excluded_files | deleted_files:
+        compacted.data.pop(filename, None)
+
+    compacted_content = json.dumps(baseline.format_for_output(compacted), indent=2)
+    _, compacted_load_time = load_secrets(compacted_content, args.baseline)
+
+    size = len(baseline_content.encode())
+    compacted_size = len(compacted_content.encode())
+    print(f"files: {len(secrets.files)} -> {len(compacted.files)}")
+    print(f"- {len(deleted_files)} deleted or moved in the depot")
+    print(f"- {len(excluded_files)} excluded from the scan")
+    print(f"- {merged_file_count} merged by the filename normalization")
+    if len(unchecked_files) > 0:
+        print(f"{len(unchecked_files)} files couldn't be checked (not in the client view?) and are kept:")
+        print(*sorted(unchecked_files), sep="\n")
+    print(f"secrets: {count_secrets(secrets)} -> {count_secrets(compacted)}")
+    print(f"size: {size / 1024:.1f} KB -> {compacted_size / 1024:.1f} KB ({100 * (size - compacted_size) / max(size, 1):.1f}% smaller)")
+    print(f"load time: {load_time:.3f}s -> {compacted_load_time:.3f}s")
+
+    # the trigger compares the secrets per file, so false positives copied in several files are kept
+    duplicated_hash_count, duplicated_entry_count = count_duplicated_false_positives(compacted)
+    if duplicated_hash_count > 0:
+        print(f"{duplicated_hash_count} false positives are duplicated in {duplicated_entry_count} files (kept)")
+
+    if args.dry_run or compacted.files == secrets.files:
+        print("Baseline not modified.")
+    else:
+        edit = p4.run("edit", "-c", args.changelist, args.baseline)
+        print(f"p4 edit: {edit}")
+        with open(args.baseline, "w") as fd:
+            fd.write(compacted_content)
+        print(f"Secret Baseline successfully compacted ({args.baseline})")
+
+    p4.disconnect()
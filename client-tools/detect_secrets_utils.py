@@ -1,20 +1,27 @@
 """ utils functions to manage secret detection
 """
 
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from detect_secrets import SecretsCollection, exceptions
 from detect_secrets.core import baseline
 from detect_secrets.core.log import log
+from detect_secrets.core.potential_secret import PotentialSecret
 from detect_secrets.core.scan import _process_line_based_plugins
 from detect_secrets.main import handle_audit_action
+from detect_secrets.settings import default_settings, get_plugins, transient_settings
 from detect_secrets.transformers import get_transformed_file
 from detect_secrets.types import NamedIO
+from detect_secrets.util.inject import get_injectable_variables
 from P4 import P4
-from typing import Generator, cast, List, Optional
+from typing import Any, Dict, Generator, cast, List, Optional, Set, Tuple
 import argparse
 import io
+import json
+import os
 import re
 import sys
+import time
 
 
 SECRET_BASELINE = ".secrets.baseline"
@@ -29,6 +36,10 @@ FILE_EXCLUSION_REGEX = [
 ]
 
 
+# p4 base file types whose content is never scanned, see `p4 help filetypes`
+NON_TEXT_FILE_TYPES = ("apple", "resource", "symlink")
+
+
 def do_exclude_file(file_path: str):
     for regex in FILE_EXCLUSION_REGEX:
         if regex.search(file_path.lower()):
@@ -36,6 +47,16 @@ def do_exclude_file(file_path: str):
     return False
 
 
+def do_exclude_revision(action: str, file_type: str):
+    """Check the `describe`/`files`/`fstat` metadata, to skip deleted and binary revisions without printing them."""
+
+    if "delete" in action or action in ("purge", "archive"):
+        return True
+
+    base_type = file_type.split("+")[0]
+    return "binary" in base_type or base_type in NON_TEXT_FILE_TYPES
+
+
 def partial_merge(self, new_results: "SecretsCollection", scanned_files: Optional[List[str]]) -> None:
     """Merge a SecretsCollection with a scan made on a partial list of files.
     It works like SecretsCollection.merge, but keep the files not scanned using the provided scanned_files argument.
@@ -127,6 +148,72 @@ def depot_path_to_workspace_path(p4: P4, depot_path: str):
     return relative_path
 
 
+def normalize_baseline_filename(filename: str) -> str:
+    filename = filename.replace("\\", "/")
+    while filename.startswith("./"):
+        filename = filename[2:]
+    return filename
+
+
+# p4 reads these characters as revision or wildcard syntax in a file argument, `%` must be escaped first
+P4_SPECIAL_CHARACTERS = [("%", "%25"), ("@", "%40"), ("#", "%23"), ("*", "%2A")]
+
+P4_MISSING_FILE_WARNING_REGEX = re.compile(r"^(.*) - no such file\(s\)\.$")
+
+
+def escape_p4_path(path: str) -> str:
+    for character, escaped in P4_SPECIAL_CHARACTERS:
+        path = path.replace(character, escaped)
+    return path
+
+
+def unescape_p4_path(path: str) -> str:
+    for character, escaped in reversed(P4_SPECIAL_CHARACTERS):
+        path = path.replace(escaped, character)
+    return path
+
+
+def get_deleted_files(p4: P4, filenames: List[str], batch_size: int = 500) -> Tuple[Set[str], Set[str]]:
+    """Return the workspace relative `filenames` deleted from the depot, and the ones that couldn't be checked.
+    A file is only deleted if `p4 fstat` reports its head revision as deleted or if p4 reports it doesn't exist,
+    files not reported at all (e.g. not in client view) are returned as not checked.
+    Checked with one `p4 fstat` per batch of files instead of one per file, must be run from the workspace root.
+    """
+
+    deleted_files = set()
+    unchecked_files = set()
+    for start in range(0, len(filenames), batch_size):
+        batch = filenames[start : start + batch_size]
+        local_paths = {os.path.normcase(os.path.abspath(filename)): filename for filename in batch}
+
+        reported_files = set()
+        for fstat in p4.run("fstat", "-T", "clientFile,headAction,action", *[escape_p4_path(filename) for filename in batch]):
+            if "clientFile" not in fstat:
+                continue
+            filename = local_paths.get(os.path.normcase(os.path.abspath(unescape_p4_path(fstat["clientFile"]))))
+            if filename is None:
+                continue
+            reported_files.add(filename)
+
+            action = fstat.get("action", "")
+            head_action = fstat.get("headAction", "")
+            is_head_deleted = "delete" in head_action or head_action in ("purge", "archive")
+            if is_head_deleted and action not in ("add", "branch", "move/add"):
+                deleted_files.add(filename)
+
+        for warning in p4.warnings:
+            m = P4_MISSING_FILE_WARNING_REGEX.search(warning.strip())
+            if not m:
+                continue
+            filename = local_paths.get(os.path.normcase(os.path.abspath(unescape_p4_path(m.group(1)))))
+            if filename is not None and filename not in reported_files:
+                reported_files.add(filename)
+                deleted_files.add(filename)
+
+        unchecked_files.update(filename for filename in batch if filename not in reported_files)
+    return deleted_files, unchecked_files
+
+
 def revert_last_shelve(p4, changelist):
     cl_description = p4.run("describe", "-s", "-S", changelist)
     if len(cl_description) == 0:
@@ -179,25 +266,182 @@ def get_secret_lines_from_file(file_io: NamedIO) -> Generator[List[str], None, N
     yield lines
 
 
-def _scan_secret_file(secrets: SecretsCollection, file_io: NamedIO):
+NO_EXTENSION = "(none)"
+PLUGIN_STATS_VERSION = 1
+PLUGIN_PROFILE_VERSION = 1
+
+
+def get_file_extension(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    return extension if len(extension) > 0 else NO_EXTENSION
+
+
+class PluginProfiler:
+    """Record per-plugin time, examined lines and hits, grouped by file extension.
+    Plugins of the current settings are wrapped when a file is started, so it works with any settings context.
+    """
+
+    def __init__(self):
+        self.extensions = {}
+        self._extension = NO_EXTENSION
+        self.is_eager_pass = False
+        self._secret_types = {}
+
+    def start_file(self, file_path: str):
+        self._extension = get_file_extension(file_path)
+        self.is_eager_pass = False
+        self._get_extension_stats()["files"] += 1
+        for plugin in get_plugins():
+            self._get_plugin_stats(plugin.__class__.__name__)
+            if not getattr(plugin, "_is_profiled", False):
+                self._wrap_plugin(plugin)
+
+    def record_hit(self, secret: PotentialSecret):
+        plugin_name = self._secret_types.get(secret.type, secret.type)
+        self._get_plugin_stats(plugin_name)["hits"] += 1
+
+    def _get_extension_stats(self) -> Dict[str, Any]:
+        return self.extensions.setdefault(self._extension, {"files": 0, "plugins": {}})
+
+    def _get_plugin_stats(self, plugin_name: str) -> Dict[str, Any]:
+        return self._get_extension_stats()["plugins"].setdefault(plugin_name, {"time": 0.0, "lines": 0, "hits": 0})
+
+    def _wrap_plugin(self, plugin):
+        plugin_name = plugin.__class__.__name__
+        analyze_line = plugin.analyze_line
+        self._secret_types[plugin.secret_type] = plugin_name
+
+        def profiled_analyze_line(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return analyze_line(*args, **kwargs)
+            finally:
+                plugin_stats = self._get_plugin_stats(plugin_name)
+                plugin_stats["time"] += time.perf_counter() - start
+                if not self.is_eager_pass:
+                    plugin_stats["lines"] += 1
+
+        # detect_secrets only passes the arguments listed in `injectable_variables` (read from
+        # `__code__.co_varnames`, so `*args, **kwargs` would get nothing), use the plugin ones without `self`
+        profiled_analyze_line.injectable_variables = set(get_injectable_variables(analyze_line)[1:])
+        profiled_analyze_line.path = f"{plugin.__class__}.analyze_line"
+        plugin.analyze_line = profiled_analyze_line
+        plugin._is_profiled = True
+
+    def save(self, stats_filename: str):
+        """Merge the recorded stats into `stats_filename`, so several runs can be accumulated."""
+        stats = load_plugin_stats(stats_filename)
+        merge_plugin_stats(stats, self.extensions)
+
+        # write to a temporary file first, to never leave a truncated stats file behind
+        tmp_filename = f"{stats_filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as fd:
+            fd.write(json.dumps(stats, indent=2, sort_keys=True))
+        os.replace(tmp_filename, stats_filename)
+
+    def print_report(self, file=sys.stderr):
+        print("== Plugin profiling ==", file=file)
+        for extension, extension_stats in sorted(self.extensions.items(), key=lambda item: -_get_extension_time(item[1])):
+            print(f"\n{extension} ({extension_stats['files']} files, {_get_extension_time(extension_stats):.3f}s)", file=file)
+            plugins = sorted(extension_stats["plugins"].items(), key=lambda item: -item[1]["time"])
+            for plugin_name, plugin_stats in plugins:
+                print(
+                    f"- {plugin_name:<32} {plugin_stats['time']:>9.3f}s {plugin_stats['lines']:>10} lines {plugin_stats['hits']:>6} hits",
+                    file=file,
+                )
+
+
+def _get_extension_time(extension_stats: Dict[str, Any]) -> float:
+    return sum(plugin_stats["time"] for plugin_stats in extension_stats["plugins"].values())
+
+
+def load_plugin_stats(stats_filename: str) -> Dict[str, Any]:
+    if not os.path.exists(stats_filename):
+        return {"version": PLUGIN_STATS_VERSION, "extensions": {}}
+    with open(stats_filename, "r") as fd:
+        return json.load(fd)
+
+
+def merge_plugin_stats(stats: Dict[str, Any], extensions: Dict[str, Any]):
+    for extension, extension_stats in extensions.items():
+        merged_extension = stats["extensions"].setdefault(extension, {"files": 0, "plugins": {}})
+        merged_extension["files"] += extension_stats["files"]
+        for plugin_name, plugin_stats in extension_stats["plugins"].items():
+            merged_plugin = merged_extension["plugins"].setdefault(plugin_name, {"time": 0.0, "lines": 0, "hits": 0})
+            for key in ("time", "lines", "hits"):
+                merged_plugin[key] += plugin_stats[key]
+
+
+def generate_plugin_profile(stats: Dict[str, Any], min_files: int) -> Dict[str, Any]:
+    """Keep, per extension, only the plugins that found at least one secret.
+    Extensions with less than `min_files` profiled files are left out, so they keep every plugin.
+    """
+
+    profile = {"version": PLUGIN_PROFILE_VERSION, "extensions": {}}
+    for extension, extension_stats in sorted(stats["extensions"].items()):
+        if extension_stats["files"] < min_files:
+            continue
+        profile["extensions"][extension] = sorted(
+            plugin_name for plugin_name, plugin_stats in extension_stats["plugins"].items() if plugin_stats["hits"] > 0
+        )
+    return profile
+
+
+def load_plugin_profile(profile_filename: str) -> Dict[str, Any]:
+    with open(profile_filename, "r") as fd:
+        plugin_profile = json.load(fd)
+    if plugin_profile.get("version") != PLUGIN_PROFILE_VERSION or "extensions" not in plugin_profile:
+        raise argparse.ArgumentTypeError(f"Invalid plugin profile: {profile_filename}")
+    return plugin_profile
+
+
+def is_extension_disabled(plugin_profile: Optional[Dict[str, Any]], extension: str) -> bool:
+    return plugin_profile is not None and plugin_profile["extensions"].get(extension) == []
+
+
+@contextmanager
+def plugin_profile_settings(plugin_profile: Optional[Dict[str, Any]], extension: str):
+    """Use the tuned plugins of `extension`, or every plugin if the extension is not in the profile."""
+
+    if plugin_profile is None or extension not in plugin_profile["extensions"]:
+        with default_settings() as settings:
+            yield settings
+        return
+
+    plugins_used = [{"name": plugin_name} for plugin_name in plugin_profile["extensions"][extension]]
+    with transient_settings({"plugins_used": plugins_used}) as settings:
+        yield settings
+
+
+def _scan_secret_file(secrets: SecretsCollection, file_io: NamedIO, profiler: Optional[PluginProfiler] = None):
     """Scans a file to find Potential secrets."""
 
-    for lines in get_secret_lines_from_file(cast(NamedIO, file_io)):
+    if profiler is not None:
+        profiler.start_file(file_io.name)
+
+    for pass_index, lines in enumerate(get_secret_lines_from_file(cast(NamedIO, file_io))):
+        if profiler is not None:
+            # the eager transformers pass examines the same lines again, only its time is counted
+            profiler.is_eager_pass = pass_index > 0
+
         for secret in _process_line_based_plugins(
             lines=list(enumerate(lines, 1)),
             filename=file_io.name,
         ):
+            # only count distinct findings, both passes can find the same secret
+            if profiler is not None and secret not in secrets[secret.filename]:
+                profiler.record_hit(secret)
             secrets[secret.filename].add(secret)
 
 
-def scan_secret(secrets: SecretsCollection, relative_path: str, file_content):
+def scan_secret(secrets: SecretsCollection, relative_path: str, file_content, profiler: Optional[PluginProfiler] = None):
     if not isinstance(file_content, str):  # don't scan binary files
         return
 
     file_io = io.StringIO(file_content)
     file_io.name = relative_path
     file_io.seek(0)
-    _scan_secret_file(secrets, file_io)
+    _scan_secret_file(secrets, file_io, profiler)
 
 
 def load_baseline(args: argparse.ArgumentParser):
@@ -0,0 +1,24 @@
+"""generate a tuned plugin profile from the stats recorded with `--plugin-stats`
+"""
+
+from detect_secrets_utils import generate_plugin_profile, load_plugin_stats, merge_plugin_stats
+import argparse
+import json
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stats_filename", nargs="+", help="Stats files from init_baseline.py or secret_trigger.py.")
+    parser.add_argument(
+        "--min-files",
+        type=int,
+        default=20,
+        help="Minimum number of profiled files for an extension to be tuned, others keep every plugin.",
+    )
+    args = parser.parse_args()
+
+    stats = {"extensions": {}}
+    for stats_filename in args.stats_filename:
+        merge_plugin_stats(stats, load_plugin_stats(stats_filename)["extensions"])
+
+    print(json.dumps(generate_plugin_profile(stats, args.min_files), indent=2, sort_keys=True))
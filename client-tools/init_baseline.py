@@ -3,7 +3,17 @@ from detect_secrets import SecretsCollection
 from detect_secrets.core import baseline
 from detect_secrets.core.log import log
 from detect_secrets.settings import default_settings
-from detect_secrets_utils import scan_secret, depot_path_to_workspace_path, do_exclude_file, flatten_p4_print
+from detect_secrets_utils import (
+    scan_secret,
+    depot_path_to_workspace_path,
+    do_exclude_file,
+    flatten_p4_print,
+    get_file_extension,
+    is_extension_disabled,
+    load_plugin_profile,
+    plugin_profile_settings,
+    PluginProfiler,
+)
 import argparse
 import json
 
@@ -17,28 +27,53 @@ if __name__ == "__main__":
         action="count",
         help="Verbose mode.",
     )
+    parser.add_argument(
+        "--plugin-stats",
+        help="Profile the plugins per file extension and merge the result into this stats file (see generate_plugin_profile.py).",
+    )
+    parser.add_argument(
+        "--plugin-profile",
+        help="Tuned plugin profile to use instead of enabling every plugin for every file.",
+    )
     args = parser.parse_args()
     if args.verbose:
         log.set_debug_level(args.verbose)
 
+    plugin_profile = load_plugin_profile(args.plugin_profile) if args.plugin_profile else None
+    profiler = PluginProfiler() if args.plugin_stats else None
+
     p4 = P4()
     p4.exception_level = 1  # don't raise on warnings
     p4.client = args.client  # don't raise on warnings
     p4.connect()
 
+    # group files by extension, so each extension is scanned with its own plugins
+    files_by_extension = {}
+    workspace_files = p4.run("have")
+    for file in workspace_files:
+        depot_file = file["depotFile"]
+        relative_path = depot_path_to_workspace_path(p4, depot_file)
+        if do_exclude_file(relative_path):
+            continue
+        files_by_extension.setdefault(get_file_extension(relative_path), []).append((depot_file, relative_path))
+
     secrets = SecretsCollection()
-    with default_settings():
-        workspace_files = p4.run("have")
-        for file in workspace_files:
-            depot_file = file["depotFile"]
-            relative_path = depot_path_to_workspace_path(p4, depot_file)
-            if do_exclude_file(relative_path):
-                continue
+    for extension, files in files_by_extension.items():
+        if is_extension_disabled(plugin_profile, extension):
+            continue
 
-            file_content = flatten_p4_print(p4.run("print", "-q", f"{depot_file}"))
-            if len(file_content) > 0:
-                scan_secret(secrets, relative_path, file_content)
+        with plugin_profile_settings(plugin_profile, extension):
+            for depot_file, relative_path in files:
+                file_content = flatten_p4_print(p4.run("print", "-q", f"{depot_file}"))
+                if len(file_content) > 0:
+                    scan_secret(secrets, relative_path, file_content, profiler)
 
+    # the baseline always lists every plugin, whatever the profile used to scan
+    with default_settings():
         print(json.dumps(baseline.format_for_output(secrets), indent=2))
 
+    if profiler is not None:
+        profiler.print_report()
+        profiler.save(args.plugin_stats)
+
     p4.disconnect()
@@ -0,0 +1,190 @@
+"""scan every submitted revision of a changelist range, to audit the secrets that ever entered the depot
+
+Revisions with an already scanned content (same digest) are skipped and the scan runs in parallel processes.
+The progress is checkpointed per changelist, run the same command again to resume it.
+"""
+
+from P4 import P4
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from detect_secrets import SecretsCollection
+from detect_secrets.core.log import log
+from detect_secrets.settings import default_settings
+from detect_secrets_utils import do_exclude_file, do_exclude_revision, flatten_p4_print, scan_secret
+import argparse
+import json
+import os
+import sys
+
+
+worker_p4 = None
+
+
+def connect() -> P4:
+    p4 = P4()
+    p4.exception_level = 1  # don't raise on warnings
+    p4.connect()
+    return p4
+
+
+def init_worker():
+    global worker_p4
+    worker_p4 = connect()
+
+
+def scan_revisions(revisions: list):
+    """Run in a worker process: print and scan the (depotFile, rev) revisions, return the secrets found per `depotFile#rev`.
+    The files are scanned under their depot path without the revision, detect_secrets picks its plugins from the extension.
+    """
+
+    secrets = SecretsCollection()
+    revision_names = {}
+    with default_settings():
+        for depot_file, rev in revisions:
+            revision_names[depot_file] = f"{depot_file}#{rev}"
+            file_content = flatten_p4_print(worker_p4.run("print", "-q", revision_names[depot_file]))
+            if len(file_content) > 0:
+                scan_secret(secrets, depot_file, file_content)
+
+    return {revision_names[filename]: [secret.json() for secret in secrets[filename]] for filename in secrets.files}
+
+
+def get_changelist_revisions(p4: P4, depot_path: str, changelist: int, digests: set):
+    """List the revisions of the changelist to scan, skipping the contents already scanned.
+    The new digests are added to `digests` and returned so they can be checkpointed with the changelist.
+    """
+
+    revisions = []
+    new_digests = []
+    for fstat in p4.run("fstat", "-Ol", f"{depot_path}@={changelist}"):
+        if "depotFile" not in fstat or "headRev" not in fstat:
+            continue
+        if do_exclude_file(fstat["depotFile"]) or do_exclude_revision(fstat.get("headAction", ""), fstat.get("headType", "text")):
+            continue
+
+        digest = fstat.get("digest")
+        if digest is not None:
+            if digest in digests:
+                continue
+            digests.add(digest)
+            new_digests.append(digest)
+
+        revisions.append((fstat["depotFile"], fstat["headRev"]))
+    return revisions, new_digests
+
+
+def load_checkpoint(checkpoint_filename: str):
+    """The checkpoint has one json line per scanned changelist, so it's only appended to.
+    A last line truncated by an interruption is ignored, its changelist is scanned again.
+    """
+
+    scanned_changelists = set()
+    digests = set()
+    results = {}
+    if os.path.exists(checkpoint_filename):
+        with open(checkpoint_filename, "r") as fd:
+            lines = [line for line in fd if len(line.strip()) > 0]
+        for index, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                if index < len(lines) - 1:
+                    raise
+                # remove it, the next entries would be appended to it
+                print(f"Ignore the truncated last line of {checkpoint_filename}", file=sys.stderr)
+                with open(checkpoint_filename, "w") as fd:
+                    fd.writelines(lines[:index])
+                break
+            scanned_changelists.add(entry["change"])
+            digests.update(entry["digests"])
+            results.update(entry["results"])
+        else:
+            if len(lines) > 0 and not lines[-1].endswith("\n"):
+                with open(checkpoint_filename, "a") as fd:
+                    fd.write("\n")
+    return scanned_changelists, digests, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("depot_path", nargs="?", default="//...", help="Depot path to audit.")
+    parser.add_argument("--first", default="1", help="First changelist of the range.")
+    parser.add_argument("--last", default="now", help="Last changelist of the range.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of scan processes.")
+    parser.add_argument(
+        "--checkpoint",
+        default=".secrets.history.checkpoint",
+        help="Progress file, the scan resumes from it if it already exists.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        help="Verbose mode.",
+    )
+    args = parser.parse_args()
+    if args.verbose:
+        log.set_debug_level(args.verbose)
+
+    p4 = connect()
+
+    scanned_changelists, digests, results = load_checkpoint(args.checkpoint)
+    changes = p4.run("changes", "-s", "submitted", f"{args.depot_path}@{args.first},@{args.last}")
+    changes = sorted(changes, key=lambda change: int(change["change"]))  # oldest first, so a content is reported where it entered
+    print(f"{len(changes)} changelists, {len(scanned_changelists)} already scanned", file=sys.stderr)
+
+    scanned_revision_count = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker) as executor, open(args.checkpoint, "a") as checkpoint_fd:
+
+        def save_changelist(change: dict, new_digests: list, revision_results: dict):
+            changelist_results = {}
+            for revision, secrets in revision_results.items():
+                changelist_results[revision] = {
+                    "change": int(change["change"]),
+                    "user": change.get("user", ""),
+                    "time": change.get("time", ""),
+                    "secrets": secrets,
+                }
+            results.update(changelist_results)
+            entry = {"change": int(change["change"]), "digests": new_digests, "results": changelist_results}
+            checkpoint_fd.write(json.dumps(entry) + "\n")
+            checkpoint_fd.flush()
+
+        def wait_for_scans(pending: dict, return_when: str):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                change, new_digests = pending.pop(future)
+                save_changelist(change, new_digests, future.result())
+                print(f"changelist {change['change']} scanned", file=sys.stderr)
+
+        pending = {}
+        for change in changes:
+            if int(change["change"]) in scanned_changelists:
+                continue
+
+            revisions, new_digests = get_changelist_revisions(p4, args.depot_path, change["change"], digests)
+            if len(revisions) == 0:
+                save_changelist(change, new_digests, {})
+                continue
+
+            scanned_revision_count += len(revisions)
+            pending[executor.submit(scan_revisions, revisions)] = (change, new_digests)
+
+            # keep a bounded queue, so the checkpoint doesn't lag too far behind the fstat calls
+            if len(pending) >= args.jobs * 2:
+                wait_for_scans(pending, FIRST_COMPLETED)
+
+        if len(pending) > 0:
+            wait_for_scans(pending, ALL_COMPLETED)
+
+    p4.disconnect()
+
+    # the checkpoint may have been reused with a wider range
+    range_changelists = {int(change["change"]) for change in changes}
+    range_results = [(revision, result) for revision, result in results.items() if result["change"] in range_changelists]
+    report = {
+        "depot_path": args.depot_path,
+        "range": f"@{args.first},@{args.last}",
+        "results": dict(sorted(range_results, key=lambda item: (item[1]["change"], item[0]))),
+    }
+    print(f"{scanned_revision_count} revisions scanned, {len(range_results)} revisions with secrets", file=sys.stderr)
+    print(json.dumps(report, indent=2))
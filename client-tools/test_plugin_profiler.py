@@ -0,0 +1,59 @@
+"""check the plugin profiling on test_data/secret_test.ini, for detect_secrets_utils and the trigger copy.
+Each check runs in a fresh python process: detect_secrets caches the plugins arguments, a scan made before
+the profiling in the same process would hide a broken wrapper.
+
+run: python test_plugin_profiler.py (or pytest)
+"""
+
+from pathlib import Path
+import json
+import subprocess
+import sys
+
+
+CLIENT_TOOLS_DIR = Path(__file__).absolute().parent
+TRIGGER_DIR = CLIENT_TOOLS_DIR.parent / "server-triggers"
+TEST_FILE = CLIENT_TOOLS_DIR / "test_data" / "secret_test.ini"
+
+CHECK_SCRIPT = """
+import json, sys
+sys.path.insert(0, {module_dir!r})
+from detect_secrets import SecretsCollection
+from detect_secrets.settings import default_settings
+from {module} import PluginProfiler, scan_secret
+
+profiler = PluginProfiler()
+secrets = SecretsCollection()
+with default_settings():
+    with open({test_file!r}, "r") as fd:
+        scan_secret(secrets, "secret_test.ini", fd.read(), profiler)
+print(json.dumps({{"secret_count": len(list(secrets)), "extensions": profiler.extensions}}))
+"""
+
+
+def run_profiler_check(module: str, module_dir: Path):
+    script = CHECK_SCRIPT.format(module=module, module_dir=str(module_dir), test_file=str(TEST_FILE))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    output = json.loads(result.stdout.splitlines()[-1])
+    assert output["secret_count"] > 0
+    extension_stats = output["extensions"][".ini"]
+    assert extension_stats["files"] == 1
+    assert all(plugin_stats["lines"] > 0 for plugin_stats in extension_stats["plugins"].values())
+    # hits are distinct findings, even when the eager transformers pass finds a secret again
+    assert sum(plugin_stats["hits"] for plugin_stats in extension_stats["plugins"].values()) == output["secret_count"]
+
+
+def test_utils_plugin_profiler():
+    run_profiler_check("detect_secrets_utils", CLIENT_TOOLS_DIR)
+
+
+def test_trigger_plugin_profiler():
+    run_profiler_check("secret_trigger", TRIGGER_DIR)
+
+
+if __name__ == "__main__":
+    test_utils_plugin_profiler()
+    test_trigger_plugin_profiler()
+    print("ok")
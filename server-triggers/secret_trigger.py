@@ -16,22 +16,38 @@ register it using `p4 triggers`
     secret_commit change-content //yourDepotPath/... "python3 secret_trigger.py %user% %client% %change% --is-change-content [-g swarm_review_exclusion]"
 """
 
+import time
+
+# taken before any other import, so the reported startup time includes them
+START_TIME = time.perf_counter()
+
 from P4 import P4
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from detect_secrets import SecretsCollection
-from detect_secrets.core import baseline
-from detect_secrets.core.log import log
-from detect_secrets.core.scan import _process_line_based_plugins
-from detect_secrets.pre_commit_hook import pretty_print_diagnostics
-from detect_secrets.settings import default_settings
-from detect_secrets.transformers import get_transformed_file
-from detect_secrets.types import NamedIO
-from typing import Dict, Any, cast, Generator, List
+from types import SimpleNamespace
+from typing import Dict, Any, cast, Generator, List, Optional, TYPE_CHECKING
 import argparse
+import atexit
+import glob
 import io
 import json
+import os
 import re
 import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+# detect_secrets and its plugins are only imported once we know there is a file to scan,
+# most shelves only contain binary assets and don't need them.
+if TYPE_CHECKING:
+    from detect_secrets import SecretsCollection
+    from detect_secrets.core.potential_secret import PotentialSecret
+    from detect_secrets.types import NamedIO
 
 
 SECRET_BASELINE = ".secrets.baseline"
@@ -46,6 +62,10 @@ FILE_EXCLUSION_REGEX = [
 ]
 
 
+# p4 base file types whose content is never scanned, see `p4 help filetypes`
+NON_TEXT_FILE_TYPES = ("apple", "resource", "symlink")
+
+
 def do_exclude_file(file_path: str):
     for regex in FILE_EXCLUSION_REGEX:
         if regex.search(file_path.lower()):
@@ -53,6 +73,20 @@ def do_exclude_file(file_path: str):
     return False
 
 
+def do_exclude_revision(action: str, file_type: str):
+    """Check the `describe`/`files` metadata, to skip deleted and binary revisions without printing them."""
+
+    if "delete" in action or action in ("purge", "archive"):
+        return True
+
+    base_type = file_type.split("+")[0]
+    return "binary" in base_type or base_type in NON_TEXT_FILE_TYPES
+
+
+def get_elapsed_time() -> str:
+    return f"{time.perf_counter() - START_TIME:.3f}s"
+
+
 depot_path_infos = {}
 
 
@@ -91,20 +125,20 @@ def depot_path_to_relative(p4: P4, depot_path: str):
     return relative_path
 
 
-def revert_last_shelve(p4, changelist):
+def revert_last_shelve(p4, changelist, max_shelve_age: float = 20):
     cl_description = p4.run("describe", "-s", "-S", changelist)
     if len(cl_description) == 0:
-        print(f"Invalid changelist({changelist})")
+        print(f"Invalid changelist({changelist}) ({get_elapsed_time()})")
         sys.exit(0)
 
     cl_description = cl_description[0]
     if "depotFile" not in cl_description or len(cl_description["depotFile"]) == 0:
-        print(f"No file in depot for changelist({changelist})")
+        print(f"No file in depot for changelist({changelist}) ({get_elapsed_time()})")
         sys.exit(0)
 
     # There is no simple way to only get the files modified/added by the current submit
     # So we are using the fstat headTime/headModTime to compare it to this `min_submit_time`
-    min_submit_time = datetime.now() - timedelta(seconds=20)
+    min_submit_time = datetime.now() - timedelta(seconds=max_shelve_age)
     for depot_file in cl_description["depotFile"]:
         depo_path = f"{depot_file}@={changelist}"
 
@@ -119,8 +153,12 @@ def revert_last_shelve(p4, changelist):
             p4.run("shelve", "-f", "-d", "-Af", "-c", changelist, depot_file)
 
 
-def get_secret_lines_from_file(file_io: NamedIO) -> Generator[List[str], None, None]:
+def get_secret_lines_from_file(
+    file_io: "NamedIO",
+) -> Generator[List[str], None, None]:
     """equivalent of scan._get_lines_from_file but using a NamedIO as the file"""
+    from detect_secrets.core.log import log
+    from detect_secrets.transformers import get_transformed_file
 
     log.info(f"Checking file: {file_io.name}")
 
@@ -143,25 +181,189 @@ def get_secret_lines_from_file(file_io: NamedIO) -> Generator[List[str], None, N
     yield lines
 
 
-def _scan_secret_file(secrets: SecretsCollection, file_io: NamedIO):
+NO_EXTENSION = "(none)"
+PLUGIN_STATS_VERSION = 1
+PLUGIN_PROFILE_VERSION = 1
+
+
+def get_file_extension(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    return extension if len(extension) > 0 else NO_EXTENSION
+
+
+class PluginProfiler:
+    """Record per-plugin time, examined lines and hits, grouped by file extension.
+    Same as detect_secrets_utils.PluginProfiler, the stats files can be mixed.
+    """
+
+    def __init__(self):
+        self.extensions = {}
+        self._extension = NO_EXTENSION
+        self.is_eager_pass = False
+        self._secret_types = {}
+
+    def start_file(self, file_path: str):
+        from detect_secrets.settings import get_plugins
+
+        self._extension = get_file_extension(file_path)
+        self.is_eager_pass = False
+        self._get_extension_stats()["files"] += 1
+        for plugin in get_plugins():
+            self._get_plugin_stats(plugin.__class__.__name__)
+            if not getattr(plugin, "_is_profiled", False):
+                self._wrap_plugin(plugin)
+
+    def record_hit(self, secret: "PotentialSecret"):
+        plugin_name = self._secret_types.get(secret.type, secret.type)
+        self._get_plugin_stats(plugin_name)["hits"] += 1
+
+    def _get_extension_stats(self) -> Dict[str, Any]:
+        return self.extensions.setdefault(self._extension, {"files": 0, "plugins": {}})
+
+    def _get_plugin_stats(self, plugin_name: str) -> Dict[str, Any]:
+        return self._get_extension_stats()["plugins"].setdefault(
+            plugin_name, {"time": 0.0, "lines": 0, "hits": 0}
+        )
+
+    def _wrap_plugin(self, plugin):
+        from detect_secrets.util.inject import get_injectable_variables
+
+        plugin_name = plugin.__class__.__name__
+        analyze_line = plugin.analyze_line
+        self._secret_types[plugin.secret_type] = plugin_name
+
+        def profiled_analyze_line(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return analyze_line(*args, **kwargs)
+            finally:
+                plugin_stats = self._get_plugin_stats(plugin_name)
+                plugin_stats["time"] += time.perf_counter() - start
+                if not self.is_eager_pass:
+                    plugin_stats["lines"] += 1
+
+        # detect_secrets only passes the arguments listed in `injectable_variables`
+        # (read from `__code__.co_varnames`, so `*args, **kwargs` would get nothing),
+        # use the plugin ones without `self`
+        profiled_analyze_line.injectable_variables = set(
+            get_injectable_variables(analyze_line)[1:]
+        )
+        profiled_analyze_line.path = f"{plugin.__class__}.analyze_line"
+        plugin.analyze_line = profiled_analyze_line
+        plugin._is_profiled = True
+
+    def save(self, stats_filename: str):
+        """Merge the recorded stats into `stats_filename`, so every trigger run is accumulated.
+        The read-merge-write is done under a lock file, concurrent triggers would overwrite each other counts.
+        """
+        with open(f"{stats_filename}.lock", "a") as lock_fd:
+            while not try_lock_file(lock_fd):
+                time.sleep(AdmissionController.POLL_INTERVAL)
+            self._merge_into(stats_filename)
+
+    def _merge_into(self, stats_filename: str):
+        stats = {"version": PLUGIN_STATS_VERSION, "extensions": {}}
+        if os.path.exists(stats_filename):
+            with open(stats_filename, "r") as fd:
+                stats = json.load(fd)
+
+        for extension, extension_stats in self.extensions.items():
+            merged_extension = stats["extensions"].setdefault(
+                extension, {"files": 0, "plugins": {}}
+            )
+            merged_extension["files"] += extension_stats["files"]
+            for plugin_name, plugin_stats in extension_stats["plugins"].items():
+                merged_plugin = merged_extension["plugins"].setdefault(
+                    plugin_name, {"time": 0.0, "lines": 0, "hits": 0}
+                )
+                for key in ("time", "lines", "hits"):
+                    merged_plugin[key] += plugin_stats[key]
+
+        # write to a temporary file first, to never leave a truncated stats file behind
+        tmp_filename = f"{stats_filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as fd:
+            fd.write(json.dumps(stats, indent=2, sort_keys=True))
+        os.replace(tmp_filename, stats_filename)
+
+
+def load_plugin_profile(profile_filename: str) -> Dict[str, Any]:
+    with open(profile_filename, "r") as fd:
+        plugin_profile = json.load(fd)
+    if (
+        plugin_profile.get("version") != PLUGIN_PROFILE_VERSION
+        or "extensions" not in plugin_profile
+    ):
+        raise ValueError(f"Invalid plugin profile: {profile_filename}")
+    return plugin_profile
+
+
+def is_extension_disabled(
+    plugin_profile: Optional[Dict[str, Any]], extension: str
+) -> bool:
+    return (
+        plugin_profile is not None and plugin_profile["extensions"].get(extension) == []
+    )
+
+
+@contextmanager
+def plugin_profile_settings(plugin_profile: Optional[Dict[str, Any]], extension: str):
+    """Use the tuned plugins of `extension`, or every plugin if the extension is not in the profile."""
+    from detect_secrets.settings import default_settings, transient_settings
+
+    if plugin_profile is None or extension not in plugin_profile["extensions"]:
+        with default_settings() as settings:
+            yield settings
+        return
+
+    plugins_used = [
+        {"name": plugin_name} for plugin_name in plugin_profile["extensions"][extension]
+    ]
+    with transient_settings({"plugins_used": plugins_used}) as settings:
+        yield settings
+
+
+def _scan_secret_file(
+    secrets: "SecretsCollection",
+    file_io: "NamedIO",
+    profiler: Optional[PluginProfiler] = None,
+):
     """Scans a file to find Potential secrets."""
+    from detect_secrets.core.scan import _process_line_based_plugins
+    from detect_secrets.types import NamedIO
+
+    if profiler is not None:
+        profiler.start_file(file_io.name)
+
+    for pass_index, lines in enumerate(
+        get_secret_lines_from_file(cast(NamedIO, file_io))
+    ):
+        if profiler is not None:
+            # the eager transformers pass examines the same lines again, only its time is counted
+            profiler.is_eager_pass = pass_index > 0
 
-    for lines in get_secret_lines_from_file(cast(NamedIO, file_io)):
         for secret in _process_line_based_plugins(
             lines=list(enumerate(lines, 1)),
             filename=file_io.name,
         ):
+            # only count distinct findings, both passes can find the same secret
+            if profiler is not None and secret not in secrets[secret.filename]:
+                profiler.record_hit(secret)
             secrets[secret.filename].add(secret)
 
 
-def scan_secret(secrets: SecretsCollection, relative_path: str, file_content):
+def scan_secret(
+    secrets: "SecretsCollection",
+    relative_path: str,
+    file_content,
+    profiler: Optional[PluginProfiler] = None,
+):
     if not isinstance(file_content, str):  # don't scan binary files
         return
 
     file_io = io.StringIO(file_content)
     file_io.name = relative_path
     file_io.seek(0)
-    _scan_secret_file(secrets, file_io)
+    _scan_secret_file(secrets, file_io, profiler)
 
 
 def flatten_p4_print(p4_print_result: list):
@@ -170,6 +372,123 @@ def flatten_p4_print(p4_print_result: list):
     return "".join(p4_print_result[1:])
 
 
+def import_detect_secrets() -> SimpleNamespace:
+    """Import the detect_secrets modules of the scan, only called once we know there is a file to scan."""
+    from detect_secrets import SecretsCollection
+    from detect_secrets.core import baseline
+    from detect_secrets.pre_commit_hook import pretty_print_diagnostics
+    from detect_secrets.settings import default_settings
+
+    return SimpleNamespace(
+        SecretsCollection=SecretsCollection,
+        baseline=baseline,
+        pretty_print_diagnostics=pretty_print_diagnostics,
+        default_settings=default_settings,
+    )
+
+
+def try_lock_file(fd) -> bool:
+    """Non blocking exclusive lock, released by the OS when the process exits."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            fd.seek(0)
+            msvcrt.locking(fd.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class AdmissionController:
+    """Cross-process semaphore limiting the number of concurrent scans on the trigger host.
+
+    Each of the `max_concurrent` slots is a lock file in `lock_dir`.
+    Submits (change-content) have the priority: while one is waiting, it holds a locked
+    `submit-<pid>.wait` file and shelves don't take a free slot.
+    """
+
+    POLL_INTERVAL = 0.05
+    MAX_POLL_INTERVAL = 0.5
+
+    def __init__(self, lock_dir: str, max_concurrent: int, is_submit: bool):
+        self.lock_dir = lock_dir
+        self.max_concurrent = max_concurrent
+        self.is_submit = is_submit
+        self._slot_fd = None
+        self._wait_fd = None
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def try_acquire(self) -> bool:
+        if not self.is_submit and self._is_submit_waiting():
+            return False
+
+        for slot in range(self.max_concurrent):
+            fd = open(os.path.join(self.lock_dir, f"slot-{slot}.lock"), "a")
+            if try_lock_file(fd):
+                self._slot_fd = fd
+                return True
+            fd.close()
+        return False
+
+    def acquire(self, timeout: float) -> float:
+        """Wait for a slot, return the time waited or raise TimeoutError."""
+
+        start = time.perf_counter()
+        if self.is_submit:
+            self._mark_submit_waiting()
+
+        try:
+            poll_interval = self.POLL_INTERVAL
+            while not self.try_acquire():
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError()
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
+        finally:
+            self._unmark_submit_waiting()
+
+        return time.perf_counter() - start
+
+    def release(self):
+        if self._slot_fd is not None:
+            self._slot_fd.close()
+            self._slot_fd = None
+
+    def _wait_filename(self) -> str:
+        return os.path.join(self.lock_dir, f"submit-{os.getpid()}.wait")
+
+    def _mark_submit_waiting(self):
+        self._wait_fd = open(self._wait_filename(), "a")
+        # a shelve probing the marker holds its lock for a moment, retry until we own it
+        # or the marker would look stale for the whole wait
+        while not try_lock_file(self._wait_fd):
+            time.sleep(0.001)
+
+    def _unmark_submit_waiting(self):
+        if self._wait_fd is None:
+            return
+        self._wait_fd.close()
+        self._wait_fd = None
+        try:
+            os.remove(self._wait_filename())
+        except OSError:
+            pass
+
+    def _is_submit_waiting(self) -> bool:
+        for wait_filename in glob.glob(os.path.join(self.lock_dir, "submit-*.wait")):
+            try:
+                fd = open(wait_filename, "a")
+            except OSError:
+                continue
+            # an unlocked file was left by a submit that crashed while waiting
+            is_waiting = not try_lock_file(fd)
+            fd.close()
+            if is_waiting:
+                return True
+        return False
+
+
 if __name__ == "__main__":
     print("\n")  # to write script logs on a different line than the perforce trigger error message
 
@@ -188,8 +507,38 @@ if __name__ == "__main__":
         action="store_true",
         help="Use this if you use the trigger as a change-content.",
     )
+    parser.add_argument(
+        "--plugin-stats",
+        help="Profile the plugins per file extension and merge the result into this stats file.",
+    )
+    parser.add_argument(
+        "--plugin-profile",
+        help="Tuned plugin profile (from generate_plugin_profile.py) to use instead of every plugin.",
+    )
+    parser.add_argument(
+        "--max-concurrent-scans",
+        type=int,
+        default=0,
+        help="Limit the number of triggers scanning at the same time on this host, submits first (0 = no limit).",
+    )
+    parser.add_argument(
+        "--admission-timeout",
+        type=float,
+        default=120,
+        help="Maximum time in seconds to wait for a scan slot, the trigger fails after it.",
+    )
+    parser.add_argument(
+        "--admission-dir",
+        default=os.path.join(tempfile.gettempdir(), "p4-detect-secrets"),
+        help="Directory of the lock files shared by the triggers.",
+    )
     args = parser.parse_args()
 
+    plugin_profile = None
+    if args.plugin_profile:
+        plugin_profile = load_plugin_profile(args.plugin_profile)
+    profiler = PluginProfiler() if args.plugin_stats else None
+
     p4 = P4()
     p4.exception_level = 1  # don't raise on warnings
     # We are using "swarm" user instead of "buildbot" because it need admin right to delete shelved files
@@ -205,43 +554,111 @@ if __name__ == "__main__":
             if "group" in user_group and user_group["group"] == args.exclude_group:
                 is_from_exclude_group = True
         if is_from_exclude_group:
-            print("User is from the exclude_group, exit trigger")
+            print(
+                f"User is from the exclude_group, exit trigger ({get_elapsed_time()})"
+            )
             sys.exit(0)
 
-    secrets = SecretsCollection()
-    with default_settings():
-        cl_description = p4.run("describe", "-s", "-S", args.changelist)
-        if len(cl_description) == 0:
-            print(f"Invalid changelist({args.changelist})")
-            sys.exit(1)
+    cl_description = p4.run("describe", "-s", "-S", args.changelist)
+    if len(cl_description) == 0:
+        print(f"Invalid changelist({args.changelist}) ({get_elapsed_time()})")
+        sys.exit(1)
 
-        cl_description = cl_description[0]
-        depotFile = []
-        if "depotFile" in cl_description and len(cl_description["depotFile"]) > 0:
-            depotFile = cl_description["depotFile"]
+    cl_description = cl_description[0]
+    cl_files = []  # (depotFile, action, type)
+    if "depotFile" in cl_description and len(cl_description["depotFile"]) > 0:
+        actions = cl_description.get("action", [])
+        file_types = cl_description.get("type", [])
+        for index, depot_file in enumerate(cl_description["depotFile"]):
+            action = actions[index] if index < len(actions) else ""
+            file_type = file_types[index] if index < len(file_types) else "text"
+            cl_files.append((depot_file, action, file_type))
+    else:
+        if args.is_change_content:
+            for file in p4.run("files", f"//...@={ args.changelist}"):
+                if "depotFile" not in file or len(file["depotFile"]) == 0:
+                    continue
+                cl_files.append(
+                    (
+                        file["depotFile"],
+                        file.get("action", ""),
+                        file.get("type", "text"),
+                    )
+                )
         else:
-            if args.is_change_content:
-                cl_files = p4.run("files", f"//...@={ args.changelist}")
-                for file in cl_files:
-                    if "depotFile" not in file or len(file["depotFile"]) == 0:
-                        continue
-                    depotFile.append(file["depotFile"])
-            else:
-                print(f"No file in depot for changelist({args.changelist})")
+            print(
+                f"No file in depot for changelist({args.changelist}) ({get_elapsed_time()})"
+            )
+            sys.exit(1)
+
+    # group changelist files by extension, so each extension is scanned with its own plugins
+    files_by_extension = {}
+    for depot_file, action, file_type in cl_files:
+        relative_path = depot_path_to_relative(p4, depot_file)
+
+        if do_exclude_file(relative_path) or do_exclude_revision(action, file_type):
+            continue
+
+        extension = get_file_extension(relative_path)
+        if is_extension_disabled(plugin_profile, extension):
+            continue
+
+        files_by_extension.setdefault(extension, []).append((depot_file, relative_path))
+
+    if len(files_by_extension) == 0:
+        print(f"No file to scan, exit trigger (startup {get_elapsed_time()})")
+        p4.disconnect()
+        sys.exit(0)
+
+    # wait for a scan slot, so concurrent triggers queue instead of all loading detect_secrets
+    if args.max_concurrent_scans > 0:
+        admission = AdmissionController(
+            args.admission_dir, args.max_concurrent_scans, args.is_change_content
+        )
+        atexit.register(admission.release)
+        if not admission.try_acquire():
+            # don't keep a server connection open while queued
+            p4.disconnect()
+            try:
+                wait_time = admission.acquire(args.admission_timeout)
+            except TimeoutError:
+                print(
+                    f"Too many secret scans running on the server, please retry ({get_elapsed_time()})"
+                )
+                # the files are already shelved, delete them instead of keeping them unscanned
+                if not args.is_change_content:
+                    p4.connect()
+                    # the shelve happened before the trigger started, not in the last 20s
+                    revert_last_shelve(
+                        p4, args.changelist, 20 + time.perf_counter() - START_TIME
+                    )
+                    p4.disconnect()
                 sys.exit(1)
+            p4.connect()
+            print(f"Waited {wait_time:.3f}s for a scan slot")
+
+    # only load detect_secrets now that we know there is something to scan
+    import_start_time = time.perf_counter()
+    detect_secrets = import_detect_secrets()
+    print(
+        f"detect_secrets loaded in {time.perf_counter() - import_start_time:.3f}s"
+        f" (startup {get_elapsed_time()})"
+    )
 
+    secrets = detect_secrets.SecretsCollection()
+    with detect_secrets.default_settings():
         # scan changelist files
-        for depot_file in depotFile:
-            relative_path = depot_path_to_relative(p4, depot_file)
-
-            if do_exclude_file(relative_path):
-                continue
+        for extension, files in files_by_extension.items():
+            with plugin_profile_settings(plugin_profile, extension):
+                for depot_file, relative_path in files:
+                    file_content = flatten_p4_print(
+                        p4.run("print", "-q", f"{depot_file}@={args.changelist}")
+                    )
+                    if len(file_content) > 0:
+                        scan_secret(secrets, relative_path, file_content, profiler)
 
-            file_content = flatten_p4_print(
-                p4.run("print", "-q", f"{depot_file}@={args.changelist}")
-            )
-            if len(file_content) > 0:
-                scan_secret(secrets, relative_path, file_content)
+        if profiler is not None:
+            profiler.save(args.plugin_stats)
 
         # retrieve depot path
         if len(depot_path_infos) == 0:
@@ -265,7 +682,7 @@ if __name__ == "__main__":
 
         # load baseline
         if len(baseline_content) == 0:
-            args.baseline = SecretsCollection()
+            args.baseline = detect_secrets.SecretsCollection()
             args.baseline_filename = ""
         else:
             try:
@@ -273,11 +690,13 @@ if __name__ == "__main__":
                 if len(baseline_content) > 0:
                     loaded_baseline = cast(Dict[str, Any], json.loads(baseline_content))
                     args.baseline_version = loaded_baseline["version"]
-                    args.baseline = baseline.load(
+                    args.baseline = detect_secrets.baseline.load(
                         loaded_baseline, filename=args.baseline_filename
                     )
             except Exception as e:
-                print(f"Invalid baseline: {args.baseline_filename}\n")
+                print(
+                    f"Invalid baseline: {args.baseline_filename} ({get_elapsed_time()})\n"
+                )
                 print(e)
                 sys.exit(1)
 
@@ -300,13 +719,15 @@ if __name__ == "__main__":
             )
             print("----------------------")
             print("\n== Detected Secrets ==\n")
-            pretty_print_diagnostics(new_secrets)
+            detect_secrets.pretty_print_diagnostics(new_secrets)
             print("\n======================")
 
             if not args.is_change_content:
                 revert_last_shelve(p4, args.changelist)
 
+            print(f"Secrets detected ({get_elapsed_time()})")
             p4.disconnect()
             sys.exit(1)
 
+        print(f"No secret detected ({get_elapsed_time()})")
         p4.disconnect()